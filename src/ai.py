@@ -1,9 +1,12 @@
 import asyncio
-import json
+import orjson
 import requests
 import os
 import uuid
+import threading
+from collections import Counter
 from typing import Optional, Dict, Any
+from pydantic import BaseModel
 
 from models import (
     TaskStatus, 
@@ -20,7 +23,7 @@ from services.audio import AudioService
 from services.transcription import TranscriptionService
 from services.segmentation import SegmentationService
 from services.question_generation import QuestionGenerationService
-from services.storage import GCloudStorageService
+from services.storage import GCloudStorageService, content_digest
 
 # Get webhook configuration from environment
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
@@ -35,12 +38,42 @@ if not WEBHOOK_SECRET:
 webhook_url: str = WEBHOOK_URL
 webhook_secret: str = WEBHOOK_SECRET
 
+# Shared session so webhooks and file downloads reuse keep-alive connections.
+# Each background task runs its own event loop in its own thread, so calls go
+# through asyncio.to_thread rather than an AsyncClient bound to a single loop.
+http_session = requests.Session()
+
 # Global dictionary to track service instances for cancellation
 active_services = {}
 
+# Question generation slots held per job_id (a rerun of a running job holds a second slot);
+# new jobs are rejected past the cap. Tasks release slots from their own threads, hence the lock
+question_generation_jobs = Counter()
+_question_generation_lock = threading.Lock()
+MAX_CONCURRENT_QUESTION_JOBS = int(os.getenv("QGEN_MAX_CONCURRENT_JOBS", "4"))
+
 # Note: Removed the old JobState class and process_video_async function
 # as they used in-memory job_states which is now replaced with MongoDB persistence
 
+async def warm_question_generation_model():
+    """Load the default question generation model ahead of the question generation task"""
+    # Best-effort: a failed warm-up only means the model loads on first use
+    try:
+        question_service = QuestionGenerationService()
+        try:
+            await question_service.warm_model(keep_alive=os.getenv("LLM_KEEP_ALIVE", "30m"))
+        finally:
+            await question_service.aclose()
+    except Exception as e:
+        print(f"Question generation model warm-up failed: {str(e)}")
+
+def start_question_generation_warmup():
+    """Warm the question generation model in the background without tying it to the calling job"""
+    # Own thread and event loop: a slow model load must not keep the job running after it reports done
+    threading.Thread(
+        target=asyncio.run, args=(warm_question_generation_model(),), name="qgen-warmup", daemon=True
+    ).start()
+
 async def start_audio_extraction_task(job_id: str, url) -> Dict[str, Any]:
     print(f"start_audio_extraction_task called for job {job_id}")
 
@@ -61,6 +94,9 @@ async def start_audio_extraction_task(job_id: str, url) -> Dict[str, Any]:
         
         # Note: Job status updates are handled by the external system, not this read-only service
         
+        # Load the question generation model while the audio downloads
+        start_question_generation_warmup()
+        
         # Extract audio from video
         print(f"Extracting audio from video: {url}")
         audio_file_path = await audio_service.extractAudio(url)
@@ -125,9 +161,10 @@ async def start_transcript_generation_task(job_id: str, file: str, approval_data
         transcript = await transcription_service.transcribe(file, approval_data.modelSize, approval_data.language)
         del transcript["text"]
         # Upload transcript to Google Cloud Storage
-        run_id = str(uuid.uuid4())[:8]  # Use first 8 characters of UUID for uniqueness
-        transcript_file_name = f"transcripts/{job_id}_{run_id}_transcript.json"
-        transcript_file_url = await storage_service.upload_json_content(transcript, transcript_file_name)
+        # Name the file by its content so a rerun producing the same transcript reuses the stored object
+        transcript_json = orjson.dumps(transcript)
+        transcript_file_name = f"transcripts/{job_id}_{content_digest(transcript_json)}_transcript.json"
+        transcript_file_url = await storage_service.upload_json_content(transcript_json, transcript_file_name, skip_if_exists=True)
         print(f"Transcript uploaded successfully to: {transcript_file_url}")
         # Send webhook - Transcription completed
         transcript_data = TranscriptGenerationData(
@@ -171,7 +208,7 @@ async def start_segmentation_task(job_id: str, file: str, approval_data: Optiona
             # Download the transcript file from GCloud bucket
             print(f"Downloading transcript from: {file}")
             try:
-                response = requests.get(file)
+                response = await asyncio.to_thread(http_session.get, file)
                 response.raise_for_status()
                 transcript = response.text
                 print(f"Successfully downloaded transcript: {len(transcript)} characters")
@@ -239,6 +276,10 @@ def map_transcript_to_segments(chunks, segmentmap):
     prev_end = 0.0
 
     for end_time in segmentmap:
+        if end_time in segment_dict:
+            # A repeated end time would overwrite the segment with empty text
+            print(f"Warning: duplicate end time {end_time} in segment map, skipping")
+            continue
         segment_text = ""
         for chunk in chunks:
             chunk_end = chunk["timestamp"][1]
@@ -266,11 +307,11 @@ async def start_question_generation_task(job_id: str, segmentMap, file, approval
             current_webhook_url = "http://" + current_webhook_url
             
         storage_service = GCloudStorageService()
-        response = requests.get(file)
+        response = await asyncio.to_thread(http_session.get, file)
         response.raise_for_status()
         transcript = response.text
         # convert json to dict
-        transcript = json.loads(transcript)
+        transcript = orjson.loads(transcript)
         segments = map_transcript_to_segments(transcript['chunks'], segmentMap)
         # Send webhook - Starting question generation
         question_gen_data = QuestionGenerationData(status=TaskStatus.RUNNING)
@@ -289,12 +330,10 @@ async def start_question_generation_task(job_id: str, segmentMap, file, approval
                 question_params=approval_data,
                 job_id=job_id  # Pass job_id separately
             )
-            questions = [json.loads(q) for q in questions]
-            questions = [i for s in questions for i in s]
             # Upload questions to Google Cloud Storage
-            run_id = str(uuid.uuid4())[:8]  # Use first 8 characters of UUID for uniqueness
-            questions_file_name = f"questions/{job_id}_{run_id}_questions.json"
-            questions_file_url = await storage_service.upload_json_content(questions, questions_file_name)
+            questions_json = orjson.dumps(questions)
+            questions_file_name = f"questions/{job_id}_{content_digest(questions_json)}_questions.json"
+            questions_file_url = await storage_service.upload_json_content(questions_json, questions_file_name, skip_if_exists=True)
             
             # Send webhook - Question generation completed
             if questions and len(questions) > 0:
@@ -333,6 +372,7 @@ async def start_question_generation_task(job_id: str, segmentMap, file, approval
             # Clean up service reference
             if job_id in active_services:
                 del active_services[job_id]
+            await question_service.aclose()
         
     except asyncio.CancelledError:
         print(f"Question generation task cancelled for job {job_id}")
@@ -351,6 +391,22 @@ async def start_question_generation_task(job_id: str, segmentMap, file, approval
         await send_webhook(current_webhook_url, job_id, webhook_secret, "QUESTION_GENERATION", error_data)
         raise
 
+def reserve_question_generation_slot(job_id: str) -> bool:
+    """Take a question generation slot for job_id unless the concurrency cap is reached"""
+    with _question_generation_lock:
+        if sum(question_generation_jobs.values()) >= MAX_CONCURRENT_QUESTION_JOBS:
+            return False
+        question_generation_jobs[job_id] += 1
+        return True
+
+def release_question_generation_slot(job_id: str):
+    """Give back one slot held by job_id, leaving slots of other runs of the same job alone"""
+    with _question_generation_lock:
+        if question_generation_jobs[job_id] > 1:
+            question_generation_jobs[job_id] -= 1
+        else:
+            question_generation_jobs.pop(job_id, None)
+
 def cancel_active_services(job_id: str):
     """Cancel any active services for a job"""
     if job_id in active_services:
@@ -362,9 +418,10 @@ def cancel_active_services(job_id: str):
 
 async def send_webhook(webhook_url: str, job_id: str, webhook_secret: str, task: str, data):
     """Send webhook notification"""
-    # Convert data to dict if it's a Pydantic model
-    if hasattr(data, 'dict'):
-        data_dict = data.dict()
+    # Convert data to a JSON-ready dict if it's a Pydantic model, dropping top-level None
+    # fields like the models' dict() overrides do
+    if isinstance(data, BaseModel):
+        data_dict = {k: v for k, v in data.model_dump(mode="json").items() if v is not None}
     else:
         data_dict = data
     
@@ -382,7 +439,9 @@ async def send_webhook(webhook_url: str, job_id: str, webhook_secret: str, task:
     
     try:
         print(f"Sending webhook to {webhook_url} for task {task}")
-        response = requests.post(webhook_url, json=webhook_data, headers=headers, timeout=10)
+        response = await asyncio.to_thread(
+            http_session.post, webhook_url, data=orjson.dumps(webhook_data), headers=headers, timeout=10
+        )
         print(f"Webhook response: {response.status_code}")
         response.raise_for_status()
     except Exception as e:
@@ -1,4 +1,6 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
@@ -11,6 +13,7 @@ load_dotenv()
 
 from routes import router
 from middleware.error_logging import ErrorLoggingMiddleware
+from services.transcription import TranscriptionService
 import sentry_sdk
 
 sentry_sdk.init(
@@ -18,11 +21,29 @@ sentry_sdk.init(
     environment=os.getenv("ENVIRONMENT", "development"),
     send_default_pii=True,
 )
+async def prewarm_whisper_model():
+    """Load the default Whisper model into the process-wide cache before the first job needs it"""
+    model_size = os.getenv("WHISPER_DEFAULT_MODEL", "medium")
+    try:
+        await TranscriptionService().prewarm(model_size)
+        print(f"Whisper model prewarmed: {model_size}")
+    except Exception as e:
+        print(f"Whisper prewarm failed, model will load on first use: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm in the background so the server accepts requests immediately; a job arriving
+    # mid-load waits on the model lock instead of loading a second copy
+    prewarm_task = asyncio.create_task(prewarm_whisper_model())
+    yield
+    prewarm_task.cancel()
+
 # Create FastAPI app
 app = FastAPI(
     title="AI Server",
     description="FastAPI-based AI processing server with webhook integration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add custom validation error handler
@@ -2,12 +2,15 @@ from fastapi import APIRouter, BackgroundTasks, HTTPException
 from typing import Optional
 import asyncio
 import threading
+from functools import partial
 from ai import (
     start_audio_extraction_task,
     start_transcript_generation_task,
     start_segmentation_task,
     start_question_generation_task,
-    cancel_active_services
+    cancel_active_services,
+    reserve_question_generation_slot,
+    release_question_generation_slot
 )
 from models import (
     JobResponse,
@@ -19,12 +22,31 @@ from models import (
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
+def ensure_question_generation_capacity(job_id: str):
+    """Reserve a question generation slot, rejecting with 503 instead of queueing behind a saturated LLM"""
+    # Taken before the task is scheduled so a burst can't overshoot the cap; released by
+    # run_async_task when the task's thread ends
+    if not reserve_question_generation_slot(job_id):
+        raise HTTPException(
+            status_code=503,
+            detail="Question generation is at capacity, retry later",
+            headers={"Retry-After": "2"}
+        )
+
 # Global dictionary to track running tasks
 running_tasks = {}
 
-def run_async_task(job_id, async_func, *args, **kwargs):
+def run_async_task(job_id, async_func, *args, on_finish=None, **kwargs):
     """Helper function to run async tasks in a new thread with its own event loop"""
     def run_in_thread():
+        try:
+            run_task()
+        finally:
+            # Runs even if the task is cancelled before its first step
+            if on_finish:
+                on_finish()
+
+    def run_task():
         try:
             print(f"Starting background task: {async_func.__name__} for job {job_id}")
             # Create a new event loop for this thread
@@ -58,7 +80,12 @@ def run_async_task(job_id, async_func, *args, **kwargs):
     
     # Run in a separate thread
     thread = threading.Thread(target=run_in_thread)
-    thread.start()
+    try:
+        thread.start()
+    except Exception:
+        if on_finish:
+            on_finish()
+        raise
 
 @router.post("/{jobId}/tasks/approve/start", response_model=JobResponse)
 async def approve_task_start(
@@ -77,7 +104,7 @@ async def approve_task_start(
     print(f"Approve task start called for job {jobId}")
     current_task = taskData.currentTask
     task_status = taskData.taskStatus
-    print(f"Job {jobId} current_task: {current_task}, task_status: {task_status}, file: {taskData.file if hasattr(taskData, 'file') else None}, parameters: {taskData.parameters if hasattr(taskData, 'parameters') else None}")
+    print(f"Job {jobId} current_task: {current_task}, task_status: {task_status}, file: {taskData.file}, parameters: {taskData.parameters}")
     
     # Only start if task is waiting for approval (WAITING)
     if task_status != "WAITING":
@@ -85,31 +112,36 @@ async def approve_task_start(
     
     # Start the appropriate task based on current_task
     if current_task is None:
-        # Start audio extraction task - needs job_data object with url
+        # Start audio extraction task - needs the video url
         print(f"Starting audio extraction task for job {jobId}")
-        job_data_obj = type('JobData', (), {'url': taskData.url if hasattr(taskData, 'url') else None})()
-        background_tasks.add_task(run_async_task, jobId, start_audio_extraction_task, jobId, job_data_obj.url)
+        background_tasks.add_task(run_async_task, jobId, start_audio_extraction_task, jobId, taskData.url)
         return JobResponse(message="Audio extraction task started")
     elif current_task == "AUDIO_EXTRACTION":
         # Start transcript generation task - needs file and parameters
-        file_url = taskData.file if hasattr(taskData, 'file') else None
+        file_url = taskData.file
         print(f"Starting transcript generation task for job {jobId}")
-        params = TranscriptParameters(**taskData.parameters) if hasattr(taskData, 'parameters') else None
+        params = TranscriptParameters(**taskData.parameters) if taskData.parameters is not None else None
         background_tasks.add_task(run_async_task, jobId, start_transcript_generation_task, jobId, file_url, params)
         return JobResponse(message="Transcript generation task started")
     elif current_task == "TRANSCRIPT_GENERATION":
         # Start segmentation task - needs parameters only
-        file_url = taskData.file if hasattr(taskData, 'file') else None
+        file_url = taskData.file
         print(f"Starting segmentation task for job {jobId}")
-        params = SegmentationParameters(**taskData.parameters) if hasattr(taskData, 'parameters') else None
+        params = SegmentationParameters(**taskData.parameters) if taskData.parameters is not None else None
         background_tasks.add_task(run_async_task, jobId, start_segmentation_task, jobId, file_url, params)
         return JobResponse(message="Segmentation task started")
     elif current_task == "SEGMENTATION":
         # Start question generation task - needs parameters only
-        file_url = taskData.file if hasattr(taskData, 'file') else None
+        file_url = taskData.file
         print(f"Starting question generation task for job {jobId}")
-        params = QuestionGenerationParameters(**taskData.parameters) if hasattr(taskData, 'parameters') else None
-        background_tasks.add_task(run_async_task, jobId, start_question_generation_task, jobId, taskData.segmentMap, file_url, params)
+        params = QuestionGenerationParameters(**taskData.parameters) if taskData.parameters is not None else None
+        ensure_question_generation_capacity(jobId)
+        # Started here rather than as a background task so the reserved slot always reaches the
+        # thread that releases it, even if the response is never sent
+        run_async_task(
+            jobId, start_question_generation_task, jobId, taskData.segmentMap, file_url, params,
+            on_finish=partial(release_question_generation_slot, jobId)
+        )
         return JobResponse(message="Question generation task started")
     elif current_task == "QUESTION_GENERATION":
         # Question generation is the final task - no more tasks after this
@@ -151,30 +183,35 @@ async def rerun_task(
     """Rerun the current task"""
     current_task = taskData.currentTask
     task_status = taskData.taskStatus
-    print('file:', taskData.file if hasattr(taskData, 'file') else None)
-    print('parameters:', taskData.parameters if hasattr(taskData, 'parameters') else None)
+    print('file:', taskData.file)
+    print('parameters:', taskData.parameters)
     if task_status not in ["COMPLETED", "FAILED", "ABORTED"]:
         raise HTTPException(status_code=400, detail=f"Current task {current_task} is not completed (status: {task_status})")
     
     if current_task == "AUDIO_EXTRACTION":
-        job_data_obj = type('JobData', (), {'url': taskData.url if hasattr(taskData, 'url') else None})()
-        background_tasks.add_task(run_async_task, jobId, start_audio_extraction_task, jobId, job_data_obj.url)
+        background_tasks.add_task(run_async_task, jobId, start_audio_extraction_task, jobId, taskData.url)
         return JobResponse(message="Audio extraction task restarted", jobId=jobId)
     elif current_task == "TRANSCRIPT_GENERATION":
-        file_url = taskData.file if hasattr(taskData, 'file') else None
-        params = TranscriptParameters(**taskData.parameters) if hasattr(taskData, 'parameters') else None
+        file_url = taskData.file
+        params = TranscriptParameters(**taskData.parameters) if taskData.parameters is not None else None
         print(params)
         background_tasks.add_task(run_async_task, jobId, start_transcript_generation_task, jobId, file_url, params)
         return JobResponse(message="Transcript generation task restarted", jobId=jobId)
     elif current_task == "SEGMENTATION":
-        file_url = taskData.file if hasattr(taskData, 'file') else None
-        params = SegmentationParameters(**taskData.parameters) if hasattr(taskData, 'parameters') else None
+        file_url = taskData.file
+        params = SegmentationParameters(**taskData.parameters) if taskData.parameters is not None else None
         background_tasks.add_task(run_async_task, jobId, start_segmentation_task, jobId, file_url, params)
         return JobResponse(message="Segmentation task restarted", jobId=jobId)
     elif current_task == "QUESTION_GENERATION":
-        file_url = taskData.file if hasattr(taskData, 'file') else None
-        params = QuestionGenerationParameters(**taskData.parameters) if hasattr(taskData, 'parameters') else None
-        background_tasks.add_task(run_async_task, jobId, start_question_generation_task, jobId, taskData.segmentMap, file_url, params)
+        file_url = taskData.file
+        params = QuestionGenerationParameters(**taskData.parameters) if taskData.parameters is not None else None
+        ensure_question_generation_capacity(jobId)
+        # Started here rather than as a background task so the reserved slot always reaches the
+        # thread that releases it, even if the response is never sent
+        run_async_task(
+            jobId, start_question_generation_task, jobId, taskData.segmentMap, file_url, params,
+            on_finish=partial(release_question_generation_slot, jobId)
+        )
         return JobResponse(message="Question generation task restarted", jobId=jobId)
     else:
         raise HTTPException(status_code=400, detail=f"Unknown task: {current_task}")
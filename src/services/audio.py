@@ -1,8 +1,12 @@
 import os
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import yt_dlp
 
+# Dedicated pool so concurrent downloads don't compete with other default-executor work
+_download_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ytdl")
+
 class AudioService:
     async def extractAudio(self, videoPath: str) -> str:
         """
@@ -38,18 +42,19 @@ class AudioService:
         Returns:
             str: Path to the downloaded audio file
         """
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         
         def download():
             ydl_opts = {
-                'format': 'bestaudio/best',
+                # Prefer Opus streams, libopus decodes them cheaply
+                'format': 'bestaudio[acodec^=opus]/bestaudio/best',
                 'outtmpl': str(temp_dir / '%(title)s_%(id)s.%(ext)s'),
                 'postprocessors': [{
                     'key': 'FFmpegExtractAudio',
                     'preferredcodec': 'wav',
-                    'preferredquality': '192',
                 }],
-                'postprocessor_args': ['-ar', '16000', '-ac', '1'],  # 16kHz, mono
+                # Single FFmpeg pass straight to 16kHz mono 16-bit PCM
+                'postprocessor_args': ['-vn', '-ac', '1', '-ar', '16000', '-c:a', 'pcm_s16le'],
                 'quiet': True,
                 'no_warnings': True,
             }
@@ -62,4 +67,4 @@ class AudioService:
                 audio_filename = os.path.splitext(filename)[0] + '.wav'
                 return audio_filename
         
-        return await loop.run_in_executor(None, download)
+        return await loop.run_in_executor(_download_pool, download)
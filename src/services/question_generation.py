@@ -1,50 +1,111 @@
-import json
 import re
 import os
-from typing import Dict, List, Optional
-import requests
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+import orjson
 import asyncio
 from fastapi import HTTPException
 from schema import SOL_SCHEMA, SML_SCHEMA, OTL_SCHEMA, NAT_SCHEMA, DES_SCHEMA
 
 from models import QuestionGenerationParameters
 
-class QuestionGenerationService:
-    """Service for generating questions from transcript segments"""
-    
-    def __init__(self):
-        self.ollama_api_base_url = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api")
-        self.active_sessions = {}  # Track active request sessions for cancellation
-        
-        # Question schemas for different types
-        self.question_schemas = {
-            "SOL": SOL_SCHEMA,
-            "SML": SML_SCHEMA,
-            "OTL": OTL_SCHEMA,
-            "NAT": NAT_SCHEMA,
-            "DES": DES_SCHEMA,
-            "BIN": SOL_SCHEMA
+DEFAULT_MODEL = "deepseek-r1:70b"
+
+# Question schemas for different types
+QUESTION_SCHEMAS = {
+    "SOL": SOL_SCHEMA,
+    "SML": SML_SCHEMA,
+    "OTL": OTL_SCHEMA,
+    "NAT": NAT_SCHEMA,
+    "DES": DES_SCHEMA,
+    "BIN": SOL_SCHEMA
+}
+
+# Pattern used to strip markdown fences (``` or ```json) from generated JSON
+_RE_FENCE = re.compile(r'```(?:json)?\s*')
+
+@lru_cache(maxsize=64)
+def _build_format_schema(question_specs: Tuple[Tuple[str, int], ...]) -> Dict:
+    """Build the object schema for (question_type, count) pairs; shared, so callers must not mutate it"""
+    properties = {
+        question_type: {
+            "type": "array",
+            "items": QUESTION_SCHEMAS[question_type],
+            "minItems": count,
+            "maxItems": count,
         }
+        for question_type, count in question_specs
+    }
+    return {"type": "object", "properties": properties, "required": list(properties)}
 
-    def extract_json_from_markdown(self, text: str) -> str:
-        """Extract JSON content from markdown-formatted text"""
-        # Remove markdown code blocks
-        text = re.sub(r'```json\s*', '', text)
-        text = re.sub(r'```\s*', '', text)
-        
-        # Remove any leading/trailing whitespace
-        text = text.strip()
-        
-        # Try to find JSON content between { } or [ ]
-        json_match = re.search(r'[\[\{].*[\]\}]', text, re.DOTALL)
-        if json_match:
-            return json_match.group(0)
-        
-        return text
+@lru_cache(maxsize=64)
+def _encode_format_schema(question_specs: Tuple[Tuple[str, int], ...]) -> orjson.Fragment:
+    """Serialize the format schema once so every request embeds the same pre-encoded bytes"""
+    return orjson.Fragment(orjson.dumps(_build_format_schema(question_specs)))
+
+class _JsonSpanScanner:
+    """Incrementally locate the first balanced JSON object or array in text fed piece by piece"""
+
+    def __init__(self):
+        self.start: Optional[int] = None  # offset of the opening bracket
+        self.end: Optional[int] = None    # offset just past the matching close
+        self.leading = True               # whether only whitespace precedes the span
+        self._offset = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> bool:
+        """Scan the next piece of text; returns True once the span is complete"""
+        if self.end is not None:
+            return True
+        begin = 0
+        if self.start is None:
+            starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+            if not starts:
+                self.leading = self.leading and text.isspace()
+                self._offset += len(text)
+                return False
+            begin = min(starts)
+            self.start = self._offset + begin
+            self.leading = self.leading and (begin == 0 or text[:begin].isspace())
+        for i in range(begin, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = self._offset + i + 1
+                    return True
+        self._offset += len(text)
+        return False
+
+def _find_json_span(text: str) -> Optional[str]:
+    """Return the first balanced JSON object or array in text, ignoring brackets inside strings"""
+    scanner = _JsonSpanScanner()
+    if scanner.feed(text):
+        return text[scanner.start:scanner.end]
+    return None
+
+class QuestionGenerationService:
+    """Service for generating questions from transcript segments"""
 
-    def create_question_prompt(self, question_type: str, count: int, transcript_content: str, base_prompt: str) -> str:
-        """Create a prompt for question generation based on type and content"""
-        base_prompt = f"""Based on the following transcript content, generate {count} educational question(s) of type {question_type}.
+    # Prompt header shared by every request; filled in per segment with str.format
+    _PROMPT_HEADER = """Based on the following transcript content, generate educational questions of the following types:
+{requested}
 
 Transcript content:
 {transcript_content}
@@ -52,10 +113,12 @@ Transcript content:
 Each question should:
 {base_prompt}
 
+Return a JSON object with one key per question type, each holding the list of questions of that type.
+
 """
 
-        type_specific_instructions = {
-                "BIN": """Create BINARY questions:
+    _TYPE_INSTRUCTIONS = {
+        "BIN": """Create BINARY questions:
 - Focus on understanding concepts, principles, or cause-and-effect relationships
 - Avoid questions about specific numbers, percentages, or statistical data
 - Clear question text that tests comprehension of ideas
@@ -66,7 +129,7 @@ Each question should:
 - Include a hint that points to the key concept or principle being tested
 - Set timeLimitSeconds to 60 and points to 5""",
 
-            "SOL": """Create SELECT_ONE_IN_LOT questions:
+        "SOL": """Create SELECT_ONE_IN_LOT questions:
 - Focus on understanding concepts, principles, or cause-and-effect relationships
 - Avoid questions about specific numbers, percentages, or statistical data
 - Clear question text that tests comprehension of ideas
@@ -76,7 +139,7 @@ Each question should:
 - Include a hint that points to the key concept or principle being tested
 - Set timeLimitSeconds to 60 and points to 5""",
 
-            "SML": """Create SELECT_MANY_IN_LOT questions (multiple correct answers):
+        "SML": """Create SELECT_MANY_IN_LOT questions (multiple correct answers):
 - Test understanding of multiple related concepts or characteristics
 - Focus on identifying key principles, factors, or elements discussed
 - Avoid numerical data or statistical information
@@ -86,7 +149,7 @@ Each question should:
 - Include a hint that mentions the number of correct answers or key criteria
 - Set timeLimitSeconds to 90 and points to 8""",
 
-            "OTL": """Create ORDER_THE_LOTS questions (ordering/sequencing):
+        "OTL": """Create ORDER_THE_LOTS questions (ordering/sequencing):
 - Focus on logical sequences, processes, or hierarchical relationships
 - Test understanding of how concepts build upon each other
 - Avoid chronological ordering based on specific dates or times
@@ -97,7 +160,7 @@ Each question should:
 - Include a hint about the ordering logic or key principle to consider
 - Set timeLimitSeconds to 120 and points to 10""",
 
-            "NAT": """Create NUMERIC_ANSWER_TYPE questions (numerical answers):
+        "NAT": """Create NUMERIC_ANSWER_TYPE questions (numerical answers):
 - Focus on conceptual calculations or estimations rather than exact figures from the content
 - Ask for ratios, proportions, or relative comparisons that require understanding
 - Avoid questions asking for specific numbers mentioned in the content
@@ -108,7 +171,7 @@ Each question should:
 - Include a hint about the mathematical relationship or concept to apply
 - Set timeLimitSeconds to 90 and points to 6""",
 
-            "DES": """Create DESCRIPTIVE questions (text-based answers):
+        "DES": """Create DESCRIPTIVE questions (text-based answers):
 - Focus on explaining concepts, analyzing relationships, or evaluating ideas
 - Test deep understanding through explanation and reasoning
 - Avoid questions asking to repeat specific facts or figures
@@ -117,26 +180,293 @@ Each question should:
 - Detailed solution text that demonstrates analytical thinking
 - Include a hint that suggests the key aspects or framework to consider
 - Set timeLimitSeconds to 300 and points to 15""",
+    }
+    
+    def __init__(self):
+        self.ollama_api_base_url = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api")
+        self.llm_api_url = os.getenv("LLM_API_URL", "http://localhost:8080")
+        self.llm_backend = os.getenv("LLM_BACKEND", "ollama").lower()
+        # Model used when a job doesn't name one; vLLM only accepts the name of the model it serves
+        self.default_model = os.getenv("LLM_MODEL") or DEFAULT_MODEL
+        if self.llm_backend == "vllm" and not os.getenv("LLM_MODEL"):
+            raise ValueError("LLM_MODEL must be set to the served model name when LLM_BACKEND=vllm")
+        self.active_tasks: Dict[str, asyncio.Task] = {}  # Track running generations for cancellation
+        # One pooled client for every request this service makes; close with aclose()
+        self._client = httpx.AsyncClient(
+            timeout=300.0,  # 5 minute timeout
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+        )
+        self._prompt_templates: Dict[Tuple[str, ...], str] = {}
+        self.max_parallel_requests = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+        # Optional on-disk response cache; only valid while generation is deterministic (temperature 0)
+        self.cache_dir = os.getenv("QGEN_CACHE_DIR")
+        self.cache_max_entries = int(os.getenv("QGEN_CACHE_MAX_ENTRIES", "10000"))
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        
+        # Question schemas for different types
+        self.question_schemas = QUESTION_SCHEMAS
+
+        # Request builders for the supported LLM servers
+        backends = {
+            "ollama": self._build_ollama_request,
+            "llamacpp": self._build_openai_chat_request,
+            "vllm": self._build_openai_chat_request,
+        }
+        if self.llm_backend not in backends:
+            raise ValueError(f"Unsupported LLM_BACKEND: {self.llm_backend}")
+        self._backend = backends[self.llm_backend]
+
+    def _build_ollama_request(self, model: str, prompt: str, format_schema: Optional[orjson.Fragment]) -> Tuple[str, Dict]:
+        """Build the URL and payload for Ollama's /api/generate endpoint"""
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {"temperature": 0}
         }
+        if format_schema:
+            payload["format"] = format_schema
+        return f"{self.ollama_api_base_url}/generate", payload
+
+    def _build_openai_chat_request(self, model: str, prompt: str, format_schema: Optional[orjson.Fragment]) -> Tuple[str, Dict]:
+        """Build the URL and payload for an OpenAI-compatible chat endpoint (llama-server, vLLM)"""
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+            "temperature": 0
+        }
+        if format_schema:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "questions", "schema": format_schema}
+            }
+        return f"{self.llm_api_url}/v1/chat/completions", payload
+
+    def _parse_stream_line(self, line: str) -> Tuple[Optional[str], bool]:
+        """Parse one streamed response line into (text delta, done)"""
+        if self.llm_backend != "ollama":
+            # OpenAI-compatible server-sent events: "data: {...}" lines terminated by "data: [DONE]"
+            if not line.startswith("data:"):
+                return None, False
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return None, True
+            choices = orjson.loads(data).get("choices") or [{}]
+            return choices[0].get("delta", {}).get("content"), choices[0].get("finish_reason") is not None
+        # Ollama: one JSON object per line
+        chunk = orjson.loads(line)
+        if "error" in chunk:
+            raise ValueError(f"Ollama error: {chunk['error']}")
+        return chunk.get("response"), bool(chunk.get("done"))
+
+    async def _accumulate_streaming_response(self, response: httpx.Response) -> str:
+        """Collect the generated text from a streamed response, stopping as soon as the JSON is complete"""
+        parts = []
+        scanner = _JsonSpanScanner()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            text, done = self._parse_stream_line(line)
+            if text:
+                parts.append(text)
+                if scanner.feed(text) and scanner.leading:
+                    # Anything after the closing bracket is unused; leaving the stream
+                    # closes the connection so the server stops generating. When text precedes
+                    # the span (reasoning, an example in prose) it may not be the answer, so
+                    # read to the end and let parse_json_response work on the full text
+                    return "".join(parts)[:scanner.end]
+            if done:
+                break
+        return "".join(parts)
 
-        return base_prompt + type_specific_instructions.get(
-            question_type, f"Generate question of type {question_type}."
+    def _cache_path(self, model: str, prompt: str, question_specs: Dict[str, int]) -> Optional[str]:
+        """Get the cache file for a (model, prompt, schema) request, or None when caching is disabled"""
+        if not self.cache_dir:
+            return None
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{self.llm_backend}|{model}|{prompt}|".encode())
+        # Hash the schema with sorted keys so the key doesn't depend on dict ordering
+        digest.update(orjson.dumps(_build_format_schema(tuple(question_specs.items())), option=orjson.OPT_SORT_KEYS))
+        return os.path.join(self.cache_dir, f"{digest.hexdigest()}.txt")
+
+    def _read_cache(self, cache_path: Optional[str]) -> Optional[str]:
+        """Return the cached generated text, if any; blocking, so call it through asyncio.to_thread"""
+        if not cache_path:
+            return None
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                generated_text = f.read()
+            # Bump the mtime so eviction drops the least recently used entries first
+            os.utime(cache_path)
+            return generated_text
+        except FileNotFoundError:
+            return None
+
+    def _write_cache(self, cache_path: Optional[str], generated_text: str):
+        """Store generated text atomically so concurrent readers never see a partial file; blocking"""
+        if not cache_path or not generated_text:
+            return
+        try:
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(generated_text)
+            os.replace(tmp_path, cache_path)
+            self._evict_cache()
+        except OSError as error:
+            print(f"Error writing question cache {cache_path}: {error}")
+
+    def _evict_cache(self):
+        """Delete the least recently used entries once the cache holds more than cache_max_entries"""
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".txt")]
+        excess = len(entries) - self.cache_max_entries
+        if excess <= 0:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    async def warm_model(self, model: Optional[str] = None, keep_alive: str = "30m"):
+        """Load the model into Ollama ahead of use and keep it resident for keep_alive"""
+        if self.llm_backend != "ollama":
+            # llama-server loads its model at startup
+            return
+        model = model or self.default_model
+        try:
+            response = await self._client.post(
+                f"{self.ollama_api_base_url}/generate",
+                json={"model": model, "prompt": "", "keep_alive": keep_alive}
+            )
+            response.raise_for_status()
+            print(f"Warmed up model {model} (keep_alive={keep_alive})")
+        except Exception as error:
+            print(f"Error warming up model {model}: {error}")
+
+    def extract_json_from_markdown(self, text: str) -> str:
+        """Extract JSON content from markdown-formatted text"""
+        # Remove markdown code blocks
+        text = _RE_FENCE.sub('', text)
+        
+        # Remove any leading/trailing whitespace
+        text = text.strip()
+        
+        # Try to find the balanced JSON content between { } or [ ]
+        json_span = _find_json_span(text)
+        if json_span:
+            return json_span
+        
+        return text
+
+    def parse_json_response(self, text: str) -> Any:
+        """Parse generated JSON, only falling back to markdown extraction when the text is not clean JSON"""
+        # Structured output is usually bare JSON, so try it as-is first
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+        return orjson.loads(self.extract_json_from_markdown(text))
+
+    def build_format_schema(self, question_specs: Dict[str, int]) -> orjson.Fragment:
+        """Build the pre-encoded structured-output schema holding a fixed-length question list per type"""
+        return _encode_format_schema(tuple(question_specs.items()))
+
+    def _prompt_template(self, question_types: Tuple[str, ...]) -> str:
+        """Get the prompt template for a set of question types, rendering it once per set"""
+        template = self._prompt_templates.get(question_types)
+        if template is None:
+            template = self._PROMPT_HEADER + "\n\n".join(
+                self._TYPE_INSTRUCTIONS.get(question_type, f"Generate question of type {question_type}.")
+                for question_type in question_types
+            )
+            self._prompt_templates[question_types] = template
+        return template
+
+    def create_question_prompt(self, question_specs: Dict[str, int], transcript_content: str, base_prompt: str) -> str:
+        """Create a single prompt covering every requested question type for one segment"""
+        requested = "\n".join(
+            f"- {count} question(s) of type {question_type}" for question_type, count in question_specs.items()
+        )
+        return self._prompt_template(tuple(question_specs)).format(
+            requested=requested, transcript_content=transcript_content, base_prompt=base_prompt
         )
 
-    async def generate_questions(self, segments: Dict[str, str], question_params: Optional['QuestionGenerationParameters'] = None, job_id: str = None) -> List[str]:
+    async def _generate_for_segment(
+        self,
+        semaphore: asyncio.Semaphore,
+        segment_ids: List[str],
+        segment_transcript: str,
+        question_specs: Dict[str, int],
+        format_schema: orjson.Fragment,
+        model: str,
+        base_prompt: str,
+    ) -> List[Dict[str, Any]]:
+        """Generate every requested question type for one transcript, shared by all segment_ids that contain it"""
+        generated_questions = []
+        segment_id = ", ".join(segment_ids)
+        try:
+            prompt = self.create_question_prompt(question_specs, segment_transcript, base_prompt)
+
+            # Cache lookups don't need an LLM slot, so they happen before taking the semaphore
+            cache_path = self._cache_path(model, prompt, question_specs)
+            generated_text = await asyncio.to_thread(self._read_cache, cache_path) if cache_path else None
+            cached = generated_text is not None
+            if cached:
+                print(f"Using cached questions for segment {segment_id}")
+            else:
+                async with semaphore:
+                    url, payload = self._backend(model, prompt, format_schema)
+
+                    async with self._client.stream(
+                        "POST", url, content=orjson.dumps(payload), headers={"Content-Type": "application/json"}
+                    ) as response:
+                        response.raise_for_status()
+                        generated_text = await self._accumulate_streaming_response(response)
+
+            if generated_text:
+                try:
+                    questions_by_type = self.parse_json_response(generated_text)
+                    for question_type in question_specs:
+                        questions = questions_by_type.get(question_type) or []
+                        if isinstance(questions, dict):
+                            questions = [questions]
+                        for sid in segment_ids:
+                            generated_questions.extend(
+                                dict(q, segmentId=sid, questionType=question_type) for q in questions
+                            )
+                    if cache_path and not cached:
+                        # Only responses that parse are cached, so a truncated reply isn't replayed on reruns
+                        await asyncio.to_thread(self._write_cache, cache_path, generated_text)
+                except Exception as error:
+                    print(f"Error parsing or annotating questions in segment {segment_id}: {error}")
+
+            else:
+                print(f"No generated text in {self.llm_backend} response for segment {segment_id}")
+
+        except httpx.HTTPError as error:
+            print(f"Error calling {self.llm_backend} API for questions in segment {segment_id}: {error}")
+
+        except Exception as error:
+            print(f"Error generating questions for segment {segment_id}: {error}")
+
+        return generated_questions
+
+    async def generate_questions(self, segments: Dict[str, str], question_params: Optional['QuestionGenerationParameters'] = None, job_id: str = None) -> List[Dict[str, Any]]:
         """
-        Generate questions based on segments and question specifications
+        Generate questions based on segments and question specifications.
+        Segments are processed concurrently, at most OLLAMA_NUM_PARALLEL at a time.
         """
-        session = requests.Session()
-        
-        # Store session for potential cancellation
+        # Store the running task so cancel_generation can interrupt in-flight requests
         if job_id:
-            self.active_sessions[job_id] = session
+            self.active_tasks[job_id] = asyncio.current_task()
         
         try:
-            model = question_params.model if question_params and question_params.model else "deepseek-r1:70b"
+            model = question_params.model if question_params and question_params.model else self.default_model
             if model == 'default':
-                model = "deepseek-r1:70b"
+                model = self.default_model
             print(question_params)
             question_specs = {
                 "SOL": question_params.SOL if question_params and question_params.SOL is not None else 2,
@@ -163,97 +493,63 @@ Each question should:
                     detail="segments is required and must be a non-empty object with segmentId as keys and transcript as values."
                 )
 
-            all_generated_questions = []
+            requested_specs = {
+                question_type: count for question_type, count in question_specs.items()
+                if isinstance(count, int) and count > 0
+            }
+            if not requested_specs:
+                return []
+
+            # Build schema for structured output; it only depends on the question specs
+            format_schema = self.build_format_schema(requested_specs)
 
-            # Process each segment
+            # Segments with identical transcripts share one request; results are fanned out to each id
+            unique_transcripts: Dict[bytes, Tuple[str, List[str]]] = {}
             for segment_id, segment_transcript in segments.items():
                 if not segment_transcript:
                     continue
+                key = hashlib.blake2b(segment_transcript.encode(), digest_size=16).digest()
+                unique_transcripts.setdefault(key, (segment_transcript, []))[1].append(segment_id)
 
-                # Generate questions for each type based on globalQuestionSpecification
-                for question_type, count in question_specs.items():
-                    if isinstance(count, int) and count > 0:
-                        try:
-                            # Check for cancellation before making request
-                            if job_id and job_id not in self.active_sessions:
-                                print(f"Task cancelled for job {job_id}, stopping question generation")
-                                raise asyncio.CancelledError("Task was cancelled")
-                            
-                            # Build schema for structured output
-                            base_schema = self.question_schemas.get(question_type)
-                            format_schema = None
-                            if base_schema:
-                              if count == 1:
-                                format_schema = base_schema
-                              else:
-                                format_schema = {
-                                    "type": "array",
-                                    "items": base_schema,
-                                    "minItems": count,
-                                    "maxItems": count,
-                                }
-
-                            prompt = self.create_question_prompt(question_type, count, segment_transcript, base_prompt)
-
-                            payload = {
-                                "model": model,
-                                "prompt": prompt,
-                                "stream": False,
-                                "options": {"temperature": 0}
-                            }
-                            
-                            if format_schema:
-                                payload["format"] = format_schema
-
-                            response = session.post(
-                                f"{self.ollama_api_base_url}/generate",
-                                json=payload,
-                                timeout=300  # 5 minute timeout
-                            )
-                            response.raise_for_status()
-
-                            if response.json() and isinstance(response.json().get('response'), str):
-                                generated_text = response.json()['response']
-                                cleaned_json_text = self.extract_json_from_markdown(generated_text)
-                                try:
-                                    questions = json.loads(cleaned_json_text)
-                                    if isinstance(questions, list):
-                                        for q in questions:
-                                            q["segmentId"] = segment_id
-                                            q["questionType"] = question_type
-                                    elif isinstance(questions, dict):
-                                        questions["segmentId"] = segment_id
-                                        questions["questionType"] = question_type
-                                    # Convert back to string before appending
-                                    all_generated_questions.append(json.dumps(questions, ensure_ascii=False))
-                                except Exception as error:
-                                    print(f"Error parsing or annotating questions for {question_type} in segment {segment_id}: {error}")
-                                
-                            else:
-                              print(f"No response data or response.response is not a string for {question_type} in segment {segment_id}")
-
-                        except requests.RequestException as error:
-                            if "cancelled" in str(error).lower():
-                                print(f"Request cancelled for job {job_id}")
-                                raise asyncio.CancelledError("Request was cancelled")
-                            print(f"Error calling Ollama API for {question_type} questions in segment {segment_id}: {error}")
-
-                        except Exception as error:
-                          print(f"Error generating {question_type} questions for segment {segment_id}: {error}")
+            # One request per unique transcript covering all question types, so the transcript
+            # is only prefilled once; requests run concurrently
+            semaphore = asyncio.Semaphore(self.max_parallel_requests)
+            results = await asyncio.gather(
+                *[
+                    self._generate_for_segment(
+                        semaphore, segment_ids, segment_transcript,
+                        requested_specs, format_schema, model, base_prompt
+                    )
+                    for segment_transcript, segment_ids in unique_transcripts.values()
+                ],
+                return_exceptions=True
+            )
+
+            all_generated_questions = []
+            for result in results:
+                if isinstance(result, asyncio.CancelledError):
+                    raise result
+                if isinstance(result, BaseException):
+                    print(f"Error generating questions: {result}")
+                    continue
+                all_generated_questions.extend(result)
 
             return all_generated_questions
         
         finally:
-            # Clean up session
-            if job_id and job_id in self.active_sessions:
-                del self.active_sessions[job_id]
-            session.close()
+            # Clean up task reference
+            if job_id:
+                self.active_tasks.pop(job_id, None)
+
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        await self._client.aclose()
 
     def cancel_generation(self, job_id: str):
         """Cancel ongoing question generation for a specific job"""
-        if job_id in self.active_sessions:
-            session = self.active_sessions[job_id]
-            session.close()
-            del self.active_sessions[job_id]
-            print(f"Cancelled question generation session for job {job_id}")
-            print(f"Cancelled question generation session for job {job_id}")
+        task = self.active_tasks.pop(job_id, None)
+        if task:
+            # Called from the request thread; cancel on the task's own event loop so
+            # CancelledError aborts the awaited HTTP requests immediately
+            task.get_loop().call_soon_threadsafe(task.cancel)
+            print(f"Cancelled question generation task for job {job_id}")
@@ -1,11 +1,66 @@
 import os
-from typing import Dict, List, Optional, Sequence
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+# UMAP runs numba-parallel kernels from several threads at once, which only the TBB layer
+# supports; "safe" raises if TBB is missing instead of letting workqueue abort the process
+os.environ.setdefault("NUMBA_THREADING_LAYER", "safe")
+
 import numpy as np
+import torch
+from numba import njit
 from fastapi import HTTPException
 from bertopic import BERTopic
 from sentence_transformers import SentenceTransformer
 
-from models import SegmentResponse, Transcript, TranscriptSegment, SegmentationParameters
+from models import SegmentResponse, Transcript, SegmentationParameters
+
+# Dedicated pool for BERTopic fits, shared by every segmentation job; each fit is already
+# multi-threaded through numba, so only a few run at once
+_bertopic_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEGMENTATION_WORKERS", "4")), thread_name_prefix="bertopic"
+)
+
+@lru_cache(maxsize=1)
+def _get_embedder() -> SentenceTransformer:
+    """Load the sentence embedding model once per process, on the GPU in FP16 when one is available"""
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    embedder = SentenceTransformer("all-mpnet-base-v2", device=device)
+    if device == "cuda":
+        embedder.half()
+    return embedder
+
+@njit(cache=True, nogil=True)
+def _dp_kernel(freq: np.ndarray, lam: float) -> np.ndarray:
+    """Compiled O(n²·|T|) DP over the prefix count table; returns the best predecessor of every prefix"""
+    n = freq.shape[0] - 1
+    num_topics = freq.shape[1]
+    dp = np.full(n + 1, np.inf)                   # best cost for prefix 0…j
+    back = np.zeros(n + 1, dtype=np.int64)        # best predecessor index
+    dp[0] = -2 * lam                              # so first segment pays +λ once
+    min_lam = min(lam, 2 * lam)                   # smallest cut penalty any span can pay
+
+    for j in range(1, n + 1):                     # end position (exclusive)
+        freq_j = freq[j]
+        for i in range(j):                        # candidate previous cut
+            # span cost is never negative, so skip cuts that cannot beat the best so far
+            if dp[i] + min_lam >= dp[j]:
+                continue
+            span_len = j - i
+            max_same_topic = 0
+            for t in range(num_topics):
+                same = freq_j[t] - freq[i, t]
+                if same > max_same_topic:
+                    max_same_topic = same
+            # short (<60) and long (>240) spans pay a doubled cut penalty
+            span_lam = 2 * lam if span_len < 60 or span_len > 240 else lam
+            cost = dp[i] + (span_len - max_same_topic) + span_lam
+            if cost < dp[j]:
+                dp[j] = cost
+                back[j] = i
+    return back
 
 
 class SegmentationService:
@@ -14,9 +69,16 @@ class SegmentationService:
     def __init__(self):
         self.ollama_api_base_url = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api")
     
-    async def run_bertopic(self, topic_model: BERTopic, sentences: List[str], embeddings: any) -> any:
+    def run_bertopic(self, sentences: List[str], embeddings: any) -> np.ndarray:
+        # BERTopic keeps fitted state, so every run gets its own instance
+        topic_model = BERTopic(min_topic_size=2)
         topics, _ = topic_model.fit_transform(sentences, embeddings)
-        return topics
+        return np.asarray(topics, dtype=np.int32)
+
+    def segmentation_run(self, sentences: List[str], embeddings: any, lam: float, noise_id: int) -> np.ndarray:
+        """One independent BERTopic fit followed by DP segmentation of its labels"""
+        topics = self.run_bertopic(sentences, embeddings)
+        return self.dp_segment(topics, lam, noise_id)
     
     """
     dynaseg.py
@@ -59,38 +121,34 @@ consensus_boundaries
     # ---------------------------------------------------------------------
     # --------------  0.  tiny clean-up to remove -1 noise labels  ---------
     # ---------------------------------------------------------------------
-    async def fix_noise(self, labels: Sequence[int], noise_id: int) -> List[int]:
-        """consensus_boundaries
+    def fix_noise(self, labels: Sequence[int], noise_id: int) -> np.ndarray:
+        """
         Replace every occurrence of *noise_id* with the most recent
         *non-noise* topic so that the DP does not have to deal with '-1'.
         """
-        fixed: List[int] = []
-        prev_valid = None
-        for z in labels:
-            if z == noise_id:
-                # if we have seen a real topic before, reuse it; otherwise 0
-                fixed.append(prev_valid if prev_valid is not None else 0)
-            else:
-                fixed.append(z)
-                prev_valid = z
-        return fixed
+        labels = np.asarray(labels, dtype=np.int32)
+        is_noise = labels == noise_id
+        # index of the most recent non-noise label at each position (-1 if none yet)
+        last_valid = np.maximum.accumulate(np.where(is_noise, -1, np.arange(labels.size)))
+        # if we have seen a real topic before, reuse it; otherwise 0
+        filled = np.where(last_valid >= 0, labels[np.maximum(last_valid, 0)], 0)
+        return np.where(is_noise, filled, labels)
 
 
     # ---------------------------------------------------------------------
     # --------------  1.  build prefix topic counts (O(n·|T|)) -------------
     # ---------------------------------------------------------------------
-    async def prefix_counts(self, labels: Sequence[int]) -> Dict[int, List[int]]:
+    def prefix_counts(self, labels: Sequence[int]) -> np.ndarray:
         """
-        freq[t][j] =   how many times topic *t* occurs in sentences 0…j-1
-        Shape:  { topic_id → (n+1)-long list }.
+        freq[j, t] =   how many times the t-th distinct topic occurs in sentences 0…j-1
+        Shape:  (n+1, |T|) int32, topics in sorted order.
         """
         n = len(labels)
-        topics = set(labels)
-        freq: Dict[int, List[int]] = {t: [0] * (n + 1) for t in topics}
+        _, topic_index = np.unique(np.asarray(labels), return_inverse=True)
+        freq = np.zeros((n + 1, topic_index.max() + 1), dtype=np.int32)
 
-        for j, z in enumerate(labels, start=1):        # 1-based prefix index
-            for t in topics:
-                freq[t][j] = freq[t][j - 1] + (1 if z == t else 0)
+        freq[np.arange(1, n + 1), topic_index] = 1     # one-hot, 1-based prefix index
+        np.cumsum(freq, axis=0, out=freq)
 
         return freq
 
@@ -98,64 +156,41 @@ consensus_boundaries
     # ---------------------------------------------------------------------
     # --------------  2.  dynamic-programming segmentation  ----------------
     # ---------------------------------------------------------------------
-    async def dp_segment(self, labels: List[int], lam: float, noise_id: int) -> List[int]:
+    def dp_segment(self, labels: Sequence[int], lam: float, noise_id: int) -> np.ndarray:
         """
         Perform DP segmentation and return a *boundary vector* of the
         same length as `labels`.  Entry i == 1  ⇒  sentence i starts a segment.
         """
         # -- Step 0  (optional) noise clean-up ---------------------------------
-        clean = await self.fix_noise(labels, noise_id)
+        clean = self.fix_noise(labels, noise_id)
 
         n = len(clean)
         if n == 0:
-            return []
+            return np.zeros(0, dtype=np.int8)
 
         # -- Step 1  prefix frequency table ------------------------------------
-        freq = await self.prefix_counts(clean)
-        topics = list(freq.keys())                    # stable order
+        freq = self.prefix_counts(clean)
 
-        # helper: O(|topics|) cost of treating [i, j) as one block
-        def span_cost(i: int, j: int) -> int:
-            span_len = j - i
-            max_same_topic = max(freq[t][j] - freq[t][i] for t in topics)
-            return span_len - max_same_topic          # disagreement count
-
-        def calc_lambda(i: int, j: int, lam: float) -> float:
-            span_len = j - i
-            if span_len < 60:
-                return 2 * lam
-            if span_len > 240:
-                return 2 * lam
-            return lam
-
-        # -- Step 2  dynamic programme -----------------------------------------
-        dp = [float("inf")] * (n + 1)                 # best cost for prefix 0…j
-        back = [0] * (n + 1)                          # best predecessor index
-        dp[0] = - 2 * lam                             # so first segment pays +λ once
-
-        for j in range(1, n + 1):                     # end position (exclusive)
-            for i in range(j):                        # candidate previous cut
-                cost = dp[i] + span_cost(i, j) + calc_lambda(i, j, lam)  # block cost + λ
-                if cost < dp[j]:
-                    dp[j] = cost
-                    back[j] = i
+        # -- Step 2  dynamic programme (compiled) -------------------------------
+        # block cost of [i, j) is its disagreement count plus the cut penalty λ
+        back = _dp_kernel(freq, float(lam))
 
         # -- Step 3  back-trace to create boundary vector ----------------------
-        boundaries = [0] * n
+        boundaries = np.zeros(n, dtype=np.int8)
         k = n
         while k > 0:
-            i = back[k]
+            i = int(back[k])
             boundaries[i] = 1                         # sentence i starts segment
             k = i                                     # jump to previous cut
         return boundaries
 
-    async def consensus_boundaries(self, boundary_runs, min_sep=3, method="topk"):
+    def consensus_boundaries(self, boundary_runs, min_sep=3, method="topk"):
         """
         Fuse N binary boundary vectors into one consensus vector.
 
         Parameters
         ----------
-        boundary_runs : List[np.ndarray]  each shape (n,), entries 0/1
+        boundary_runs : np.ndarray  shape (N, n), entries 0/1 (or a list of (n,) rows)
         min_sep       : int  hard minimum gap between consecutive cuts
         method        : "topk" | "threshold" | "localmax"
             topk       – take K = median #cuts and pick top-K probs
@@ -167,19 +202,22 @@ consensus_boundaries
         consensus : np.ndarray shape (n,), entries 0/1
         p         : np.ndarray shape (n,) probability profile
         """
-        B = np.stack(boundary_runs)           # (N, n)
-        p = B.mean(axis=0)                    # boundary probability at each index
+        B = np.asarray(boundary_runs)         # (N, n)
+        p = B.sum(axis=0, dtype=np.float32) / np.float32(B.shape[0])  # boundary probability at each index
         n = p.size
         consensus = np.zeros(n, dtype=int)
 
         if method == "topk":
             K = int(np.median(B.sum(axis=1)))        # median #cuts
             # indices sorted by probability, highest first
-            idx = np.argsort(-p)
+            idx = np.argsort(-p, kind="stable")
+            # positions closer than min_sep to an already chosen cut
+            forbidden = np.zeros(n, dtype=bool)
             chosen = []
             for j in idx:
-                if all(abs(j - c) >= min_sep for c in chosen):
+                if not forbidden[j]:
                     chosen.append(j)
+                    forbidden[max(0, j - min_sep + 1):j + min_sep] = True
                 if len(chosen) == K:
                     break
             consensus[chosen] = 1
@@ -200,35 +238,36 @@ consensus_boundaries
         return consensus, p
     
     # Add intermediate segments to reduce large gaps
-    async def add_intermediate_segments(self, segment_indices, chunks: List[TranscriptSegment], max_gap_seconds=300):
+    def add_intermediate_segments(self, segment_indices, starts: np.ndarray, ends: np.ndarray, max_gap_seconds=300):
         """Add intermediate segments if gaps are too large (>5 minutes)"""
-        new_indices = list(segment_indices)
-        
-        for i in range(len(segment_indices) - 1):
-            start_idx = segment_indices[i]
-            end_idx = segment_indices[i + 1]
-            
-            # Get time range for this gap
-            start_time = chunks[start_idx].timestamp[1] if start_idx < len(chunks) else 0
-            end_time = chunks[end_idx].timestamp[0] if end_idx < len(chunks) else start_time
-            gap_duration = end_time - start_time
-            
-            # If gap is too large, add intermediate segments
-            if gap_duration > max_gap_seconds:
-                num_splits = int(gap_duration / max_gap_seconds)
-                chunk_gap = end_idx - start_idx
-                
-                for split_num in range(1, num_splits + 1):
-                    # Calculate intermediate index proportionally
-                    intermediate_idx = start_idx + int((chunk_gap * split_num) / (num_splits + 1))
-                    
-                    # Make sure it's not too close to existing boundaries
-                    if (intermediate_idx not in new_indices and 
-                        intermediate_idx > start_idx + 3 and 
-                        intermediate_idx < end_idx - 3):
-                        new_indices.append(intermediate_idx)
-        
-        return np.sort(np.array(new_indices))
+        segment_indices = np.asarray(segment_indices, dtype=np.int64)
+
+        # Gap between the end of each segment's first chunk and the start of the next segment
+        gap_durations = starts[segment_indices[1:]] - ends[segment_indices[:-1]]
+        large_gaps = np.flatnonzero(gap_durations > max_gap_seconds)
+        if large_gaps.size == 0:
+            return segment_indices
+
+        # One entry per intermediate split: which gap it belongs to and its split number (1-based)
+        num_splits = (gap_durations[large_gaps] // max_gap_seconds).astype(np.int64)
+        gap = np.repeat(large_gaps, num_splits)
+        split_num = np.arange(gap.size) - np.repeat(np.cumsum(num_splits) - num_splits, num_splits) + 1
+
+        # Calculate intermediate indices proportionally within each gap
+        start_idx = segment_indices[gap]
+        end_idx = segment_indices[gap + 1]
+        intermediate_idx = start_idx + ((end_idx - start_idx) * split_num) // (np.repeat(num_splits, num_splits) + 1)
+
+        # Make sure they are not too close to existing boundaries or a repeat of the previous split
+        keep = (intermediate_idx > start_idx + 3) & (intermediate_idx < end_idx - 3)
+        gap, intermediate_idx = gap[keep], intermediate_idx[keep]
+        repeat = np.zeros(gap.size, dtype=bool)
+        repeat[1:] = (gap[1:] == gap[:-1]) & (intermediate_idx[1:] == intermediate_idx[:-1])
+        gap, intermediate_idx = gap[~repeat], intermediate_idx[~repeat]
+
+        # Intermediates fall strictly between their gap's boundaries, so inserting them
+        # after the gap's start keeps the result sorted without np.sort
+        return np.insert(segment_indices, gap + 1, intermediate_idx)
 
     async def segment_transcript(self, transcript: Transcript, segmentation_params: Optional[SegmentationParameters] = None) -> SegmentResponse:
         """
@@ -240,12 +279,14 @@ consensus_boundaries
         runs_param = 25
         noise_id_param = -1
 
-        if segmentation_params and segmentation_params.lam:
-            lambda_param = segmentation_params.lam
-        if segmentation_params and segmentation_params.runs:
-            runs_param = segmentation_params.runs
-        if segmentation_params and segmentation_params.noiseId:
-            noise_id_param = segmentation_params.noiseId
+        # lam and noiseId may legitimately be 0, so only None falls back to the default
+        if segmentation_params:
+            if segmentation_params.lam is not None:
+                lambda_param = segmentation_params.lam
+            if segmentation_params.runs:
+                runs_param = segmentation_params.runs
+            if segmentation_params.noiseId is not None:
+                noise_id_param = segmentation_params.noiseId
 
         if not transcript:
             raise HTTPException(
@@ -254,6 +295,9 @@ consensus_boundaries
             )
 
         chunks = transcript.chunks
+        # Chunk start/end times as parallel arrays for vectorised gap checks
+        starts = np.fromiter((chunk.timestamp[0] for chunk in chunks), dtype=np.float64, count=len(chunks))
+        ends = np.fromiter((chunk.timestamp[1] for chunk in chunks), dtype=np.float64, count=len(chunks))
 
         transcript_sentences = []
         for chunk in chunks:
@@ -261,25 +305,30 @@ consensus_boundaries
 
         #Generate Embedding of transcript sentences and find topics
         sentences = transcript_sentences
-        embedder = SentenceTransformer("all-mpnet-base-v2")
-        embeddings = embedder.encode(sentences)
-        topic_model = BERTopic(min_topic_size=2)
-
-        # Run BERTopic multiple times for consensus
-        boundary_runs = []
-
-        for _ in range(runs_param):
-            topics = await self.run_bertopic(topic_model, sentences, embeddings)
-            boundaries = await self.dp_segment(topics, lambda_param, noise_id_param)
-            boundary_runs.append(np.array(boundaries))
+        embedder = _get_embedder()
+        # BERTopic's UMAP step uses the cosine metric, so unit-length embeddings cluster the same
+        embeddings = await asyncio.to_thread(
+            embedder.encode, sentences, batch_size=128, convert_to_numpy=True, normalize_embeddings=True
+        )
+
+        # Run BERTopic multiple times for consensus; runs are independent, so they
+        # execute concurrently in the BERTopic pool off the event loop
+        loop = asyncio.get_running_loop()
+        run_boundaries = await asyncio.gather(*[
+            loop.run_in_executor(
+                _bertopic_pool, self.segmentation_run, sentences, embeddings, lambda_param, noise_id_param
+            )
+            for _ in range(runs_param)
+        ])
+        boundary_runs = np.array(run_boundaries, dtype=np.int8)  # (runs, n)
         
         # Get consensus boundaries
-        consensus, _ = await self.consensus_boundaries(boundary_runs, min_sep=3, method="topk")
+        consensus, _ = self.consensus_boundaries(boundary_runs, min_sep=3, method="topk")
         
         # Get relevant chunk indices where segments start
         segment_start_indices = np.where(consensus)[0]
         # Apply intermediate segment addition
-        segment_start_indices = await self.add_intermediate_segments(segment_start_indices, chunks, max_gap_seconds=350)
+        segment_start_indices = self.add_intermediate_segments(segment_start_indices, starts, ends, max_gap_seconds=350)
         
         # Create segments dictionary
         segments = {}
@@ -292,11 +341,7 @@ consensus_boundaries
                 end_idx = len(chunks)
             
             # Collect all text in this segment
-            segment_text = ""
-            segment_chunks = chunks[start_idx:end_idx]
-            
-            for chunk in segment_chunks:
-                segment_text += chunk.text + " "
+            segment_text = " ".join(chunk.text for chunk in chunks[start_idx:end_idx]).strip()
             
             # Use the endtime of the last chunk in the segment as the key
             last_chunk = chunks[end_idx - 1]
@@ -305,10 +350,14 @@ consensus_boundaries
                 endtime = last_chunk.timestamp[1]  # Get end_time from timestamp array
             else:
                 raise ValueError("Invalid timestamp format in chunk.")
-            # Clean up the segment text
-            segment_text = segment_text.strip()
             
-            segments[str(endtime)] = segment_text
+            key = str(endtime)
+            if key in segments:
+                # Keys must stay parseable end times, so merge rather than drop the text
+                print(f"Warning: duplicate segment end time {key}, merging segment text")
+                segments[key] = f"{segments[key]} {segment_text}"
+            else:
+                segments[key] = segment_text
             
         sorted_endtimes = sorted([float(k) for k in segments.keys()])
         print("Sorted segments:", sorted_endtimes)
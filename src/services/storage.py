@@ -1,13 +1,36 @@
 import os
-import json
-from typing import Optional, Any
+import asyncio
+import hashlib
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, Any, Union
 
 try:
     from google.cloud import storage
+    from google.cloud.storage import transfer_manager
+    from google.api_core.exceptions import PreconditionFailed
     GCLOUD_AVAILABLE = True
 except ImportError:
     GCLOUD_AVAILABLE = False
     storage = None
+    transfer_manager = None
+
+    class PreconditionFailed(Exception):
+        pass
+
+# Files at least this large are uploaded as parallel multipart chunks
+CONCURRENT_UPLOAD_THRESHOLD = 64 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+UPLOAD_MAX_WORKERS = 8
+UPLOAD_DEADLINE_SECONDS = 600
+
+# Dedicated pool for blocking GCS calls so uploads don't compete with CPU-bound default-executor work
+_upload_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gcs-io")
+
+def content_digest(content: bytes) -> str:
+    """Short content hash used to name uploads, so identical content maps to one object"""
+    return hashlib.blake2b(content, digest_size=8).hexdigest()
 
 class GCloudStorageService:
     """Google Cloud Storage service for uploading files"""
@@ -77,10 +100,26 @@ class GCloudStorageService:
             print(f"Creating blob for destination: {destination_name}")
             blob = self.bucket.blob(destination_name)
             
-            # Upload file
-            print(f"Uploading file to GCS...")
-            with open(file_path, 'rb') as file_data:
-                blob.upload_from_file(file_data, content_type=content_type)
+            # Upload file; large media goes up as concurrent chunks, small files in one request
+            blob.content_type = content_type
+            file_size = os.path.getsize(file_path)
+            # The client is blocking, so uploads run in the upload pool to keep the event loop free
+            loop = asyncio.get_running_loop()
+            if file_size >= CONCURRENT_UPLOAD_THRESHOLD:
+                print(f"Uploading file to GCS in {UPLOAD_CHUNK_SIZE // (1024 * 1024)} MiB chunks...")
+                await loop.run_in_executor(_upload_pool, partial(
+                    transfer_manager.upload_chunks_concurrently,
+                    file_path, blob,
+                    chunk_size=UPLOAD_CHUNK_SIZE,
+                    max_workers=UPLOAD_MAX_WORKERS,
+                    # The default process workers would fork from this threaded server; the
+                    # chunk uploads are network-bound, so threads are enough
+                    worker_type=transfer_manager.THREAD,
+                    deadline=UPLOAD_DEADLINE_SECONDS
+                ))
+            else:
+                print(f"Uploading file to GCS...")
+                await loop.run_in_executor(_upload_pool, blob.upload_from_filename, file_path)
             
             print(f"File uploaded successfully")
             
@@ -93,14 +132,16 @@ class GCloudStorageService:
             print(f"Error uploading file to GCS: {str(e)}")
             return None
 
-    async def upload_text_content(self, content: str, destination_name: str, content_type: str = 'text/plain') -> Optional[str]:
+    async def upload_text_content(self, content: Union[str, bytes], destination_name: str, content_type: str = 'text/plain', skip_if_exists: bool = False) -> Optional[str]:
         """
         Upload text content directly to Google Cloud Storage
         
         Args:
-            content: Text content to upload
+            content: Text content to upload (str, or already UTF-8 encoded bytes)
             destination_name: Name for the file in the bucket
             content_type: MIME type of the content
+            skip_if_exists: Keep an existing object instead of overwriting it; meant for
+                content-addressed names, where an existing object already holds this content
             
         Returns:
             Public URL of the uploaded content or None if upload failed
@@ -111,8 +152,19 @@ class GCloudStorageService:
         try:
             blob = self.bucket.blob(destination_name)
             
-            # Upload content
-            blob.upload_from_string(content, content_type=content_type)
+            # Upload content in a worker thread so concurrent uploads overlap instead of blocking the loop.
+            # if_generation_match=0 only creates the object if it doesn't exist yet, so re-uploading
+            # content-addressed files costs one rejected request instead of a full rewrite
+            upload = partial(
+                blob.upload_from_string, content, content_type=content_type,
+                if_generation_match=0 if skip_if_exists else None
+            )
+            try:
+                await asyncio.get_running_loop().run_in_executor(_upload_pool, upload)
+            except PreconditionFailed:
+                if not skip_if_exists:
+                    raise
+                print(f"GCS object already exists, skipping upload: {destination_name}")
             
             # Skip make_public() since bucket has uniform bucket-level access enabled
             # blob.make_public()
@@ -124,19 +176,21 @@ class GCloudStorageService:
         except Exception as e:
             return None
 
-    async def upload_json_content(self, data: Any, destination_name: str) -> Optional[str]:
+    async def upload_json_content(self, data: Any, destination_name: str, skip_if_exists: bool = False) -> Optional[str]:
         """
         Upload JSON data to Google Cloud Storage
         
         Args:
-            data: Data to upload as JSON (dict, list, etc.)
+            data: Data to upload as JSON (dict, list, etc.), or bytes already serialized with orjson
             destination_name: Name for the file in the bucket
+            skip_if_exists: Keep an existing object instead of overwriting it
             
         Returns:
             Public URL of the uploaded JSON or None if upload failed
         """
-        json_content = json.dumps(data)
-        return await self.upload_text_content(json_content, destination_name, 'application/json')
+        # orjson produces UTF-8 bytes, which upload_from_string sends without re-encoding
+        json_content = data if isinstance(data, bytes) else orjson.dumps(data)
+        return await self.upload_text_content(json_content, destination_name, 'application/json', skip_if_exists)
 
     def get_file_url(self, file_name: str) -> str:
         """Get the public URL for a file in the bucket"""
@@ -1,6 +1,35 @@
 import asyncio
-from typing import Any, Dict, Optional
-import whisper
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Optional
+import ctranslate2
+from faster_whisper import WhisperModel
+
+_model_lock = threading.Lock()
+
+# Dedicated pool for model loads and transcription; each transcription already uses half
+# the cores through CTranslate2 (which releases the GIL), so only a few run at once
+_transcription_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TRANSCRIPTION_WORKERS", "2")), thread_name_prefix="whisper"
+)
+
+@lru_cache(maxsize=3)
+def _cached_whisper_model(model_size: str, device: str, compute_type: str) -> WhisperModel:
+    """Load a Whisper model once per process; every TranscriptionService shares it"""
+    return WhisperModel(
+        model_size,
+        device=device,
+        compute_type=compute_type,
+        num_workers=1,
+        cpu_threads=max(1, (os.cpu_count() or 2) // 2)
+    )
+
+def _load_whisper(model_size: str, device: str, compute_type: str) -> WhisperModel:
+    # Serialize loads so concurrent jobs wait for one copy instead of loading several
+    with _model_lock:
+        return _cached_whisper_model(model_size, device, compute_type)
 
 class TranscriptionService:
     def __init__(self):
@@ -8,17 +37,83 @@ class TranscriptionService:
         self.current_model_size = None
     
     async def _load_model(self, model_size: str = "medium"):
-        """Load the Whisper model lazily"""
-        loop = asyncio.get_event_loop()
-        self.model = await loop.run_in_executor(None, lambda: whisper.load_model(model_size))
+        """Load the Whisper model lazily (CTranslate2 int8 weights, FP16 activations on GPU)"""
+        if ctranslate2.get_cuda_device_count() > 0:
+            device, compute_type = "cuda", "int8_float16"
+        else:
+            device, compute_type = "cpu", "int8"
+        loop = asyncio.get_running_loop()
+        self.model = await loop.run_in_executor(_transcription_pool, _load_whisper, model_size, device, compute_type)
         self.current_model_size = model_size
     
+    async def prewarm(self, model_size: str = "medium"):
+        """Load a Whisper model into the process-wide cache so the first transcription skips the load"""
+        await self._load_model(model_size)
+    
+    async def transcribe_stream(self, audio_path: str, model_size: Optional[str] = 'medium', language: Optional[str] = 'en') -> AsyncIterator[Dict[str, Any]]:
+        """
+        Transcribes audio with faster-whisper, yielding each chunk as soon as it is decoded.
+        
+        Args:
+            audio_path: Path/URL of the input audio file
+            model_size: Whisper model size
+            language: Spoken language code
+            
+        Yields:
+            Dict with "timestamp" ([start, end] seconds) and "text" for each segment
+        """
+        # LanguageType is a str enum; faster-whisper formats the code into its language token
+        # ("<|%s|>"), so it needs the plain value or the language is silently auto-detected
+        language = getattr(language, "value", language) or 'en'
+        
+        # Load the Whisper model with specified size
+        await self._load_model(model_size if model_size else 'medium')
+        
+        print(f"Starting Whisper transcription for: {audio_path} (model: {model_size if model_size else 'medium'}, language: {language})")
+        
+        # Segments are decoded lazily in the worker thread and handed to this loop one by one
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        stop = threading.Event()
+        
+        def run_transcription():
+            try:
+                if self.model is None:
+                    raise Exception("Whisper model is not loaded. Please check model loading.")
+                segments, _ = self.model.transcribe(
+                    audio_path, language=language, beam_size=5, vad_filter=True
+                )
+                for segment in segments:
+                    if stop.is_set():
+                        break
+                    chunk = {"timestamp": [segment.start, segment.end], "text": segment.text}
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except Exception as error:
+                loop.call_soon_threadsafe(queue.put_nowait, error)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+        
+        producer = loop.run_in_executor(_transcription_pool, run_transcription)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Stop decoding further segments if the consumer goes away early
+            stop.set()
+        await producer
+    
     async def transcribe(self, audio_path: str, model_size: Optional[str] = 'medium',  language: Optional[str] = 'en') -> Dict[str, Any]:
         """
-        Transcribes an audio file using Whisper package.
+        Transcribes an audio file using faster-whisper.
         
         Args:
-            audio_path: Path to the input audio file (WAV format expected)
+            audio_path: Path/URL of the input audio file (WAV format expected)
             transcript_params: Optional transcription parameters containing language and model settings
             
         Returns:
@@ -29,38 +124,12 @@ class TranscriptionService:
         """
         
         try:
-            # Load the Whisper model with specified size
-            await self._load_model(model_size if model_size else 'medium')
-            
-            print(f"Starting Whisper transcription for: {audio_path} (model: {model_size if model_size else 'medium'}, language: {language if language else 'en'})")
-            
-            # Run transcription in thread pool
-            loop = asyncio.get_event_loop()
+            chunks = [chunk async for chunk in self.transcribe_stream(audio_path, model_size, language)]
             
-            def run_transcription():
-                if self.model is None:
-                    raise Exception("Whisper model is not loaded. Please check model loading.")
-                result = self.model.transcribe(audio_path, language=language if language else 'en', verbose=True)
-                return result
-            
-            result = await loop.run_in_executor(None, run_transcription)
-            if not result or "text" not in result:
-                raise Exception(f"Transcription failed")
-            
-            formatted_result = {
-                "text": result["text"],  # Full transcript text
-                "chunks": []
+            return {
+                "text": "".join(chunk["text"] for chunk in chunks),  # Full transcript text
+                "chunks": chunks
             }
-            
-            # Convert segments to chunks format with timestamp arrays
-            for segment in result.get("segments", []):
-                chunk = {
-                    "timestamp": [segment["start"], segment["end"]],
-                    "text": segment["text"]
-                }
-                formatted_result["chunks"].append(chunk)
-            
-            return formatted_result
 
             
         except Exception as error: